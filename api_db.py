@@ -2,11 +2,17 @@
 """DuckDB 直接操作工具 — 后端必须停掉才能用"""
 
 import json
+from functools import lru_cache
 from pathlib import Path
 import duckdb
 
 ROOT = Path(__file__).parent
-DB_PATH = ROOT / json.loads((ROOT / "config.json").read_text())["db_path"]
+
+
+@lru_cache(maxsize=1)
+def db_path() -> Path:
+    """从 config.json 读 db_path (首次调用时才读，import 不依赖配置文件)"""
+    return ROOT / json.loads((ROOT / "config.json").read_text())["db_path"]
 
 # ============================================================================
 # 在这里写要执行的操作
@@ -24,6 +30,7 @@ def main(conn):
 READONLY = True
 
 def show(conn, sql):
+    # DuckDB 的 relation 打印自带截断 (超过约 1 万行显示 ">9999 rows")，footer 的总行数才准确，不再额外 limit
     print(conn.sql(sql))
 
 def exec(conn, sql):
@@ -32,10 +39,14 @@ def exec(conn, sql):
     print("OK:", sql[:80])
 
 def status(conn):
-    tables = conn.sql("SELECT table_name FROM information_schema.tables WHERE table_schema='main' ORDER BY table_name").fetchall()
+    # duckdb_tables() 直接读 catalog，不走 information_schema 视图
+    tables = conn.sql("SELECT table_name FROM duckdb_tables() WHERE schema_name='main' AND NOT internal ORDER BY table_name").fetchall()
     print(f"=== 表 ({len(tables)}) ===")
-    for (t,) in tables:
-        count = conn.sql(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+    # 所有表的 COUNT(*) 合并成一条 SQL，一次往返
+    counts = conn.sql(" UNION ALL ".join(
+        f"SELECT '{t}' AS name, COUNT(*) AS n FROM {t}" for (t,) in tables
+    )).fetchall() if tables else []
+    for t, count in sorted(counts):
         print(f"  {t}: {count:,} rows")
 
     print("\n=== sync_state ===")
@@ -45,7 +56,29 @@ def status(conn):
     show(conn, "SELECT source, entity, total_requests, success_requests, total_rows_synced, success_rate FROM entity_stats_meta ORDER BY source, entity")
 
     print("\n=== condition positionIds ===")
-    show(conn, """
+    for k, v in condition_stats(conn).items():
+        print(f"  {k}: {v:,}")
+
+def _db_signature():
+    """DB 文件(含 WAL)的 mtime/size，文件没动过说明数据没变"""
+    path = db_path()
+    wal = path.with_name(path.name + ".wal")
+    return [[p.stat().st_mtime_ns, p.stat().st_size] for p in (path, wal) if p.exists()]
+
+def condition_stats(conn):
+    """condition 全表扫描结果缓存到 DB 旁的 sidecar 文件，DB 没变就不再扫"""
+    sidecar = db_path().with_name(db_path().name + ".condition_stats.json")
+    sig = _db_signature()
+    # 可写模式下本进程可能刚 exec 过，不走缓存
+    if READONLY:
+        try:
+            cached = json.loads(sidecar.read_text())
+            if cached["sig"] == sig:
+                return cached["stats"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    row = conn.sql("""
         SELECT
             COUNT(*) as total,
             COUNT(positionIds) as has_pos_ids,
@@ -54,10 +87,19 @@ def status(conn):
             COUNT(*) - COUNT(resolutionTimestamp) as null_res_ts
         FROM condition
     """)
+    stats = dict(zip(row.columns, row.fetchone()))
+    if READONLY:
+        # 只是缓存: 目录只读/无权限时不写，扫描结果照常返回
+        try:
+            sidecar.write_text(json.dumps({"sig": sig, "stats": stats}))
+        except OSError:
+            pass
+    return stats
 
 if __name__ == "__main__":
-    assert DB_PATH.exists(), f"数据库不存在: {DB_PATH}"
-    conn = duckdb.connect(str(DB_PATH), read_only=READONLY)
+    path = db_path()
+    assert path.exists(), f"数据库不存在: {path}"
+    conn = duckdb.connect(str(path), read_only=READONLY)
     try:
         main(conn)
     finally:
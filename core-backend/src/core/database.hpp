@@ -1,11 +1,16 @@
 #pragma once
 
 #include "entity_definition.hpp"
+#include <algorithm>
 #include <cassert>
+#include <condition_variable>
 #include <duckdb.hpp>
 #include <mutex>
 #include <nlohmann/json.hpp>
+#include <stdexcept>
 #include <string>
+#include <type_traits>
+#include <unordered_map>
 #include <utility>
 #include <vector>
 
@@ -18,10 +23,16 @@ struct SyncCursor {
 
 class Database {
 public:
+  // 读连接池: 一条 Connection 同一时刻只能跑一个查询，多条连接让 API / sync / filler 的读互不排队
+  static constexpr size_t READ_POOL_SIZE = 4;
+  // 用户 SQL 单独的小池: 最多占住这几条，不影响 read pool
+  static constexpr size_t SQL_POOL_SIZE = 2;
+
   explicit Database(const std::string &path) {
     db_ = std::make_unique<duckdb::DuckDB>(path);
     conn_ = std::make_unique<duckdb::Connection>(*db_);
-    read_conn_ = std::make_unique<duckdb::Connection>(*db_);
+    read_pool_.init(*db_, READ_POOL_SIZE);
+    sql_pool_.init(*db_, SQL_POOL_SIZE);
   }
 
   // 表初始化
@@ -35,18 +46,18 @@ public:
 
   // 游标管理
   SyncCursor get_cursor(const std::string &source, const std::string &entity) {
-    std::string sql = "SELECT cursor_value, cursor_skip FROM sync_state WHERE source = '" +
-                      entities::escape_sql_raw(source) + "' AND entity = '" +
-                      entities::escape_sql_raw(entity) + "'";
-    std::lock_guard<std::mutex> rlock(read_mutex_);
-    auto result = read_conn_->Query(sql);
-    if (result->RowCount() == 0)
-      return {"", 0};
-    auto val = result->GetValue(0, 0);
-    auto skip = result->GetValue(1, 0);
-    return {
-        val.IsNull() ? "" : val.ToString(),
-        skip.IsNull() ? 0 : skip.GetValue<int32_t>()};
+    return with_read([&](ReadConn &rc) -> SyncCursor {
+      auto result = execute_prepared(
+          rc, "SELECT cursor_value, cursor_skip FROM sync_state WHERE source = ? AND entity = ?",
+          {duckdb::Value(source), duckdb::Value(entity)});
+      if (result->RowCount() == 0)
+        return {"", 0};
+      auto val = result->GetValue(0, 0);
+      auto skip = result->GetValue(1, 0);
+      return {
+          val.IsNull() ? "" : val.ToString(),
+          skip.IsNull() ? 0 : skip.GetValue<int32_t>()};
+    });
   }
 
   // 原子写入：数据 + cursor 在同一事务
@@ -65,21 +76,17 @@ public:
     }
     insert_sql += build_on_conflict_clause(columns);
 
-    std::string cursor_sql =
-        "INSERT OR REPLACE INTO sync_state (source, entity, cursor_value, cursor_skip, last_sync_at) VALUES (" +
-        entities::escape_sql(source) + ", " +
-        entities::escape_sql(entity) + ", " +
-        entities::escape_sql(cursor_value) + ", " +
-        std::to_string(cursor_skip) + ", CURRENT_TIMESTAMP)";
-
     std::lock_guard<std::mutex> lock(write_mutex_);
 
     auto r1 = conn_->Query("BEGIN TRANSACTION");
     assert(!r1->HasError());
     auto r2 = conn_->Query(insert_sql);
     assert(!r2->HasError());
-    auto r3 = conn_->Query(cursor_sql);
-    assert(!r3->HasError());
+    execute_prepared_write(
+        "INSERT OR REPLACE INTO sync_state (source, entity, cursor_value, cursor_skip, last_sync_at) "
+        "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        {duckdb::Value(source), duckdb::Value(entity), duckdb::Value(cursor_value),
+         duckdb::Value::INTEGER(cursor_skip)});
     auto r4 = conn_->Query("COMMIT");
     assert(!r4->HasError());
   }
@@ -91,55 +98,70 @@ public:
   }
 
   // 只读查询
+  // 行数优先取 catalog 的 estimated_size (存储层行数，不扫表)，拿不到才 COUNT(*)
+  // 有二级索引的表 (事件表的 timestamp 索引) 不能用: 改到索引列的 upsert 按 delete + insert 存储，
+  // estimated_size 会把被替换的旧行也算进去，随重复同步越来越偏大
   int64_t get_table_count(const std::string &table) {
-    std::lock_guard<std::mutex> rlock(read_mutex_);
-    auto result = read_conn_->Query("SELECT COUNT(*) FROM " + table);
-    assert(!result->HasError() && "get_table_count failed");
-    assert(result->RowCount() > 0);
-    return result->GetValue(0, 0).GetValue<int64_t>();
+    return with_read([&](ReadConn &rc) {
+      auto est = execute_prepared(
+          rc,
+          "SELECT estimated_size FROM duckdb_tables() t WHERE schema_name = 'main' AND table_name = ? "
+          "AND NOT EXISTS (SELECT 1 FROM duckdb_indexes() i "
+          "WHERE i.schema_name = t.schema_name AND i.table_name = t.table_name)",
+          {duckdb::Value(table)});
+      if (est->RowCount() > 0 && !est->GetValue(0, 0).IsNull())
+        return est->GetValue(0, 0).GetValue<int64_t>();
+      auto result = rc.conn->Query("SELECT COUNT(*) FROM " + table);
+      assert(!result->HasError() && "get_table_count failed");
+      assert(result->RowCount() > 0);
+      return result->GetValue(0, 0).GetValue<int64_t>();
+    });
   }
 
   json query_json(const std::string &sql) {
-    std::lock_guard<std::mutex> rlock(read_mutex_);
-    auto result = read_conn_->Query(sql);
-    assert(!result->HasError() && "query_json failed");
-
-    json rows = json::array();
-    auto &types = result->types;
-    auto names = result->names;
+    return with_read([&](ReadConn &rc) {
+      auto result = rc.conn->Query(sql);
+      assert(!result->HasError() && "query_json failed");
+      return to_json(*result);
+    });
+  }
 
-    for (size_t row = 0; row < result->RowCount(); ++row) {
-      json obj = json::object();
-      for (size_t col = 0; col < result->ColumnCount(); ++col) {
-        auto value = result->GetValue(col, row);
-        if (value.IsNull()) {
-          obj[names[col]] = nullptr;
-        } else {
-          switch (types[col].id()) {
-          case duckdb::LogicalTypeId::BOOLEAN:
-            obj[names[col]] = value.GetValue<bool>();
-            break;
-          case duckdb::LogicalTypeId::TINYINT:
-          case duckdb::LogicalTypeId::SMALLINT:
-          case duckdb::LogicalTypeId::INTEGER:
-            obj[names[col]] = value.GetValue<int32_t>();
-            break;
-          case duckdb::LogicalTypeId::BIGINT:
-            obj[names[col]] = value.GetValue<int64_t>();
-            break;
-          case duckdb::LogicalTypeId::FLOAT:
-          case duckdb::LogicalTypeId::DOUBLE:
-            obj[names[col]] = value.GetValue<double>();
-            break;
-          default:
-            obj[names[col]] = value.ToString();
-            break;
-          }
+  // 用户 SQL (/api/sql): 走独立的 sql_pool_，重查询不占用 API / sync 快路径的读连接
+  // 先 Prepare 校验(不执行): 语法错误、多条语句、非 SELECT 都抛 invalid_argument
+  // 结果流式取，每个 DataChunk 转换后立即序列化成 JSON 数组文本，不物化整个结果
+  std::string query_user_sql(const std::string &sql) {
+    return sql_pool_.with([&](ReadConn &rc) {
+      auto stmt = rc.conn->Prepare(sql);
+      if (stmt->HasError())
+        throw std::invalid_argument(stmt->GetError());
+      if (stmt->GetStatementType() != duckdb::StatementType::SELECT_STATEMENT)
+        throw std::invalid_argument("Only SELECT queries allowed");
+      duckdb::vector<duckdb::Value> params;
+      auto result = stmt->Execute(params, true);
+      if (result->HasError())
+        throw std::invalid_argument(result->GetError());
+      std::string out = "[";
+      while (auto chunk = result->Fetch()) {
+        if (chunk->size() == 0)
+          break;
+        json rows = json::array();
+        append_rows(rows, *chunk, result->types, result->names);
+        for (const auto &row : rows) {
+          if (out.size() > 1)
+            out += ',';
+          out += row.dump();
         }
       }
-      rows.push_back(std::move(obj));
-    }
-    return rows;
+      if (result->HasError())
+        throw std::invalid_argument(result->GetError());
+      out += ']';
+      return out;
+    });
+  }
+
+  // 参数化查询: 同一条 SQL 只 Prepare 一次(缓存 plan)，之后每次只绑定参数，无需 escape
+  json query_json(const std::string &sql, duckdb::vector<duckdb::Value> params) {
+    return with_read([&](ReadConn &rc) { return to_json(*execute_prepared(rc, sql, std::move(params))); });
   }
 
   // ============================================================================
@@ -154,23 +176,23 @@ public:
   }
 
   std::vector<std::string> get_null_positionid_conditions(int limit = 100) {
-    std::lock_guard<std::mutex> rlock(read_mutex_);
-    auto result = read_conn_->Query(
-        "SELECT id FROM condition WHERE positionIds IS NULL "
-        "ORDER BY resolutionTimestamp LIMIT " +
-        std::to_string(limit));
-    std::vector<std::string> ids;
-    assert(!result->HasError());
-    for (size_t i = 0; i < result->RowCount(); ++i) {
-      ids.push_back(result->GetValue(0, i).ToString());
-    }
-    return ids;
+    // LIMIT 走绑定参数: 不同 limit 共用同一个预编译 plan
+    return with_read([&](ReadConn &rc) {
+      auto result = execute_prepared(
+          rc, "SELECT id FROM condition WHERE positionIds IS NULL ORDER BY resolutionTimestamp LIMIT ?",
+          {duckdb::Value::BIGINT(std::max(limit, 0))});
+      std::vector<std::string> ids;
+      for (size_t i = 0; i < result->RowCount(); ++i) {
+        ids.push_back(result->GetValue(0, i).ToString());
+      }
+      return ids;
+    });
   }
 
   void update_condition_position_ids(const std::string &id, const std::string &position_ids) {
-    execute("UPDATE condition SET positionIds = " +
-            entities::escape_sql(position_ids) +
-            " WHERE id = " + entities::escape_sql(id));
+    std::lock_guard<std::mutex> lock(write_mutex_);
+    execute_prepared_write("UPDATE condition SET positionIds = ? WHERE id = ?",
+                           {duckdb::Value(position_ids), duckdb::Value(id)});
   }
 
   // ============================================================================
@@ -178,18 +200,135 @@ public:
   // ============================================================================
 
   int64_t query_single_int(const std::string &sql) {
-    std::lock_guard<std::mutex> rlock(read_mutex_);
-    auto result = read_conn_->Query(sql);
-    if (result->HasError() || result->RowCount() == 0)
-      return 0;
-    auto val = result->GetValue(0, 0);
-    return val.IsNull() ? 0 : val.GetValue<int64_t>();
+    return with_read([&](ReadConn &rc) -> int64_t {
+      auto result = rc.conn->Query(sql);
+      if (result->HasError() || result->RowCount() == 0)
+        return 0;
+      auto val = result->GetValue(0, 0);
+      return val.IsNull() ? 0 : val.GetValue<int64_t>();
+    });
   }
 
   // 获取底层 DuckDB 引用
   duckdb::DuckDB &get_duckdb() { return *db_; }
 
 private:
+  struct ReadConn {
+    std::unique_ptr<duckdb::Connection> conn;
+    std::unordered_map<std::string, std::unique_ptr<duckdb::PreparedStatement>> prepared; // 本连接上的预编译语句
+  };
+
+  struct ConnPool {
+    std::vector<ReadConn> conns;
+    std::vector<ReadConn *> free;
+    std::mutex mutex; // 保护 free
+    std::condition_variable cv;
+
+    void init(duckdb::DuckDB &db, size_t size) {
+      conns.resize(size);
+      for (auto &rc : conns) {
+        rc.conn = std::make_unique<duckdb::Connection>(db);
+        free.push_back(&rc);
+      }
+    }
+
+    // 借一条空闲连接执行 fn(ReadConn&)，结束后归还; 全部占用时等待
+    template <typename F>
+    std::invoke_result_t<F &, ReadConn &> with(F &&fn) {
+      ReadConn *rc;
+      {
+        std::unique_lock<std::mutex> lock(mutex);
+        cv.wait(lock, [this] { return !free.empty(); });
+        rc = free.back();
+        free.pop_back();
+      }
+      struct Release {
+        ConnPool *pool;
+        ReadConn *rc;
+        ~Release() {
+          {
+            std::lock_guard<std::mutex> lock(pool->mutex);
+            pool->free.push_back(rc);
+          }
+          pool->cv.notify_one();
+        }
+      } release{this, rc};
+      return fn(*rc);
+    }
+  };
+
+  template <typename F>
+  std::invoke_result_t<F &, ReadConn &> with_read(F &&fn) {
+    return read_pool_.with(std::forward<F>(fn));
+  }
+
+  // 在借到的读连接上执行预编译语句 (同一条 SQL 每条连接只 Prepare 一次)
+  static duckdb::unique_ptr<duckdb::MaterializedQueryResult> execute_prepared(ReadConn &rc, const std::string &sql,
+                                                                              duckdb::vector<duckdb::Value> params) {
+    auto &stmt = rc.prepared[sql];
+    if (!stmt) {
+      stmt = rc.conn->Prepare(sql);
+      assert(!stmt->HasError() && "prepare failed");
+    }
+    auto result = stmt->Execute(params, false);
+    assert(!result->HasError() && "prepared query failed");
+    return duckdb::unique_ptr_cast<duckdb::QueryResult, duckdb::MaterializedQueryResult>(std::move(result));
+  }
+
+  // conn_ 上执行预编译写语句 (每条 SQL 只 Prepare 一次)，调用方需持有 write_mutex_
+  void execute_prepared_write(const std::string &sql, duckdb::vector<duckdb::Value> params) {
+    auto &stmt = write_prepared_[sql];
+    if (!stmt) {
+      stmt = conn_->Prepare(sql);
+      assert(!stmt->HasError() && "prepare failed");
+    }
+    auto result = stmt->Execute(params);
+    assert(!result->HasError() && "prepared execute failed");
+  }
+
+  static json to_json(duckdb::MaterializedQueryResult &result) {
+    json rows = json::array();
+    // 按 DataChunk 遍历: result.GetValue(col, row) 每次都要按行号定位 chunk，逐块取值省掉这层开销
+    for (auto &chunk : result.Collection().Chunks())
+      append_rows(rows, chunk, result.types, result.names);
+    return rows;
+  }
+
+  static void append_rows(json &rows, duckdb::DataChunk &chunk, const duckdb::vector<duckdb::LogicalType> &types,
+                          const duckdb::vector<std::string> &names) {
+    for (size_t row = 0; row < chunk.size(); ++row) {
+      json obj = json::object();
+      for (size_t col = 0; col < names.size(); ++col) {
+        auto value = chunk.GetValue(col, row);
+        if (value.IsNull()) {
+          obj[names[col]] = nullptr;
+        } else {
+          switch (types[col].id()) {
+          case duckdb::LogicalTypeId::BOOLEAN:
+            obj[names[col]] = value.GetValue<bool>();
+            break;
+          case duckdb::LogicalTypeId::TINYINT:
+          case duckdb::LogicalTypeId::SMALLINT:
+          case duckdb::LogicalTypeId::INTEGER:
+            obj[names[col]] = value.GetValue<int32_t>();
+            break;
+          case duckdb::LogicalTypeId::BIGINT:
+            obj[names[col]] = value.GetValue<int64_t>();
+            break;
+          case duckdb::LogicalTypeId::FLOAT:
+          case duckdb::LogicalTypeId::DOUBLE:
+            obj[names[col]] = value.GetValue<double>();
+            break;
+          default:
+            obj[names[col]] = value.ToString();
+            break;
+          }
+        }
+      }
+      rows.push_back(std::move(obj));
+    }
+  }
+
   static std::string build_on_conflict_clause(const std::string &columns) {
     std::string clause = " ON CONFLICT(id) DO UPDATE SET ";
     bool first = true;
@@ -212,7 +351,8 @@ private:
 
   std::unique_ptr<duckdb::DuckDB> db_;
   std::unique_ptr<duckdb::Connection> conn_;
-  std::unique_ptr<duckdb::Connection> read_conn_;
+  std::unordered_map<std::string, std::unique_ptr<duckdb::PreparedStatement>> write_prepared_; // conn_ 上的预编译语句
+  ConnPool read_pool_;
+  ConnPool sql_pool_;
   std::mutex write_mutex_;
-  std::mutex read_mutex_;
 };
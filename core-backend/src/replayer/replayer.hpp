@@ -268,13 +268,14 @@ inline json serialize_user_list(const rebuild::Engine &engine, int limit) {
     infos.push_back({i, count});
   }
 
-  std::sort(infos.begin(), infos.end(),
-            [](const UserInfo &a, const UserInfo &b) {
-              return a.event_count > b.event_count;
-            });
+  // 只需要前 limit 个: partial_sort O(n log k)，不必全量排序
+  int n = std::max(0, std::min((int)infos.size(), limit));
+  std::partial_sort(infos.begin(), infos.begin() + n, infos.end(),
+                    [](const UserInfo &a, const UserInfo &b) {
+                      return a.event_count > b.event_count;
+                    });
 
   json result = json::array();
-  int n = std::min((int)infos.size(), limit);
   for (int i = 0; i < n; ++i) {
     result.push_back({
         {"user_addr", users[infos[i].idx]},
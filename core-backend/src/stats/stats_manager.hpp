@@ -39,6 +39,7 @@ enum class FailureKind : uint8_t {
 struct EntityStat {
   std::string source;
   std::string entity;
+  std::string table; // 落库的表 (同名 entity 可能对应不同表，如 Condition → condition / pnl_condition)
 
   // 记录数(从 DB 初始化，之后累加)
   int64_t count = 0;
@@ -103,13 +104,32 @@ public:
     return sum;
   }
 
+  // 获取指定表(跨 source 汇总)的 count; found 含义同上
+  int64_t get_total_count_for_table(const std::string &table, bool *found = nullptr) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    int64_t sum = 0;
+    bool any = false;
+    for (auto &[key, stat] : stats_) {
+      (void)key;
+      if (stat.table == table) {
+        sum += stat.count;
+        any = true;
+      }
+    }
+    if (found)
+      *found = any;
+    return sum;
+  }
+
   // 初始化 entity(设置初始 count，并从DB加载历史统计)
-  void init(const std::string &source, const std::string &entity, int64_t count, int64_t row_size_bytes) {
+  void init(const std::string &source, const std::string &entity, const std::string &table, int64_t count,
+            int64_t row_size_bytes) {
     std::lock_guard<std::mutex> lock(mutex_);
     auto key = make_key(source, entity);
     auto &stat = stats_[key];
     stat.source = source;
     stat.entity = entity;
+    stat.table = table;
     stat.count = count;
     stat.row_size_bytes = row_size_bytes;
     stat.last_update = std::chrono::steady_clock::now();
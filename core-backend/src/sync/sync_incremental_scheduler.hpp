@@ -44,7 +44,7 @@ public:
 
       int64_t count = db_.get_table_count(e->table);
       int64_t row_size_bytes = entities::estimate_row_size_bytes(e);
-      StatsManager::instance().init(source_name_, e->name, count, row_size_bytes);
+      StatsManager::instance().init(source_name_, e->name, e->table, count, row_size_bytes);
 
       executors_.emplace_back(config.subgraph_id, source_name_, e, db_, pool_,
                               [this]() { on_executor_done(); });
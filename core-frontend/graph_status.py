@@ -1,6 +1,8 @@
 """The Graph 节点状态查询"""
 import json
 import yaml
+import os
+import time
 import asyncio
 from pathlib import Path
 from typing import Optional, AsyncGenerator
@@ -9,6 +11,12 @@ from functools import lru_cache
 
 from backend_api import BACKEND_API
 
+# libyaml C 解析器比纯 Python SafeLoader 快一个数量级，没编译 libyaml 时回退
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # 常量
 CHAIN_RPCS = {
     "matic": "https://polygon-rpc.com",
@@ -23,29 +31,132 @@ NETWORK_NAMES = {
     "mainnet": "Ethereum", "arbitrum-one": "Arbitrum",
     "optimism": "Optimism", "base": "Base",
 }
+GATEWAY_URL = "https://gateway.thegraph.com/api/subgraphs/id"
 IPFS_GATEWAY = "https://ipfs.network.thegraph.com/api/v0/cat"
+IPFS_FALLBACK_GATEWAY = "https://ipfs.io/ipfs"  # 公共 IPFS gateway，与主 gateway 并发竞速
 NETWORK_SUBGRAPH_ID = "DZz4kDTdmzWLWsV373w2bSmoar3umKKH9y82SUKr5qmp"
+_INDEXERS_URL = f"{GATEWAY_URL}/{NETWORK_SUBGRAPH_ID}"
+# manifest 按 IPFS CID 内容寻址，永不变化: 解析后的 JSON 落盘到项目 data/ 下，跨进程/机器重启复用
+MANIFEST_CACHE_DIR = Path(__file__).parent.parent / "data" / "manifest"
+
+# GraphQL 查询固定为常量，参数走 variables: 每次请求的 query 文本相同，gateway 可以缓存解析结果
+_META_PAYLOAD = b'{"query":"{_meta{block{number hash timestamp}deployment hasIndexingErrors}}"}'
+_BLOCK_NUMBER_PAYLOAD = b'{"jsonrpc":"2.0","method":"eth_blockNumber","params":[],"id":1}'
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_INDEXERS_QUERY = """
+query($hashes: [String!]!, $first: Int!) {
+  subgraphDeployments(where: {ipfsHash_in: $hashes}, first: $first) {
+    id
+    ipfsHash
+    stakedTokens
+    signalledTokens
+    indexerAllocations(first: 50, orderBy: allocatedTokens, orderDirection: desc, where: {status: Active}) {
+      id
+      allocatedTokens
+      indexer {
+        id
+        stakedTokens
+        defaultDisplayName
+      }
+    }
+  }
+}
+"""
+
+_manifest_cache = {}  # L1: 进程内
+
+# chain head 跨 SSE 请求共享: 出块 2~12s，2s TTL 内直接复用
+CHAIN_HEAD_TTL = 2.0
+# 单个 subgraph 整个流程的上限: 卡住的 IPFS gateway 只拖慢自己，不挡其他 source
+SOURCE_TIMEOUT = 20.0
+# indexer 批量查询最多等 meta 这么久: 窗口内回来的合并成一次查询，迟到的 source 自己单独查
+INDEXER_BATCH_WINDOW = 0.5
+_chain_head_cache: dict[str, tuple[float, int]] = {}  # network -> (monotonic ts, block)
+
+# single-flight: 多个 SSE 客户端并发请求同一个 key 时只发一次外部请求
+_inflight: dict[tuple, asyncio.Future] = {}
+
+# 共享 AsyncClient: 所有到 gateway.thegraph.com 的请求复用同一个 TLS 连接(HTTP/2 多路复用)
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def open_graph_client() -> httpx.AsyncClient:
+    """获取(必要时创建)共享 client，app 启动时调用一次以预热"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_HTTP2,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30),
+            timeout=httpx.Timeout(15.0, connect=5.0),
+        )
+    return _client
+
 
-_manifest_cache = {}
+async def close_graph_client():
+    """app 关闭时释放共享 client"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _single_flight(key: tuple, fetch):
+    """同一 key 同时只跑一个 fetch()，其余调用者等待同一个结果"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: 某个调用者断开(被 cancel)不影响其他等待者
+    return await asyncio.shield(task)
+
+
+CONFIG_PATH = Path(__file__).parent.parent / "config.json"
 
 
 @lru_cache(maxsize=1)
-def get_config():
-    config_path = Path(__file__).parent.parent / "config.json"
-    with open(config_path) as f:
+def _load_config(mtime_ns: int) -> dict:
+    with open(CONFIG_PATH) as f:
         return json.load(f)
 
 
+@lru_cache(maxsize=1)
+def _enabled_sources(mtime_ns: int) -> tuple:
+    """(name, subgraph_id, configured_entities)，只保留 enabled 的 source"""
+    return tuple(
+        # entities 现在是 dict: {entity_name: table_name}
+        (name, src.get("subgraph_id", ""), tuple(src.get("entities", {}).keys()))
+        for name, src in _load_config(mtime_ns).get("sources", {}).items()
+        if src.get("enabled", False)
+    )
+
+
+def get_config() -> dict:
+    # 按 mtime 缓存: 配置文件改了自动重新加载
+    return _load_config(os.stat(CONFIG_PATH).st_mtime_ns)
+
+
+def get_enabled_sources() -> tuple:
+    return _enabled_sources(os.stat(CONFIG_PATH).st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _gateway_headers(api_key: str) -> dict:
+    """gateway 请求头只依赖 api_key，按 key 缓存，不必每次请求重新拼"""
+    return {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+
+
 async def fetch_subgraph_meta(client: httpx.AsyncClient, subgraph_id: str, api_key: str) -> dict:
     """查询 subgraph 的 _meta 信息"""
-    query = '{"query":"{_meta{block{number hash timestamp}deployment hasIndexingErrors}}"}'
-    url = f"https://gateway.thegraph.com/api/subgraphs/id/{subgraph_id}"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+    url = f"{GATEWAY_URL}/{subgraph_id}"
     try:
-        resp = await client.post(url, content=query, headers=headers, timeout=15)
+        resp = await client.post(url, content=_META_PAYLOAD, headers=_gateway_headers(api_key), timeout=15)
         data = resp.json()
         if "data" in data and "_meta" in data["data"]:
             return data["data"]["_meta"]
@@ -56,90 +167,84 @@ async def fetch_subgraph_meta(client: httpx.AsyncClient, subgraph_id: str, api_k
         return {"error": str(e)}
 
 
-async def fetch_deployment_indexers(client: httpx.AsyncClient, deployment_ipfs: str, api_key: str) -> dict:
-    """查询 Network Subgraph 获取 deployment 的 indexer 分配情况"""
-    query = '''
-    {
-      subgraphDeployments(where: {ipfsHash: "%s"}, first: 1) {
-        id
-        ipfsHash
-        stakedTokens
-        signalledTokens
-        indexerAllocations(first: 50, orderBy: allocatedTokens, orderDirection: desc, where: {status: Active}) {
-          id
-          allocatedTokens
-          indexer {
-            id
-            stakedTokens
-            defaultDisplayName
-          }
-        }
-      }
-    }
-    ''' % deployment_ipfs
-    
-    url = f"https://gateway.thegraph.com/api/subgraphs/id/{NETWORK_SUBGRAPH_ID}"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
+def _parse_indexer_info(dep: Optional[dict]) -> dict:
+    """把单个 subgraphDeployment 查询结果整理成 indexer 分配信息"""
+    if not dep:
+        return {"indexer_count": 0, "indexers": []}
+    allocations = dep.get("indexerAllocations", [])
+    return {
+        "indexer_count": len(allocations),
+        "total_stake": dep.get("stakedTokens", "0"),
+        "signal": dep.get("signalledTokens", "0"),
+        "indexers": [
+            {
+                "id": a["indexer"]["id"],
+                "name": a["indexer"].get("defaultDisplayName") or a["indexer"]["id"][:10] + "...",
+                "allocated": a["allocatedTokens"],
+            }
+            for a in allocations[:10]
+        ]
     }
-    
+
+
+async def fetch_deployments_indexers(client: httpx.AsyncClient, deployment_cids: list, api_key: str) -> dict:
+    """一次请求查询多个 deployment 的 indexer 分配情况 (ipfsHash_in)，返回 {cid: info}"""
+    if not deployment_cids:
+        return {}
+    cids = tuple(deployment_cids)
+    return await _single_flight(("indexers", cids), lambda: _query_deployments_indexers(client, cids, api_key))
+
+
+async def _query_deployments_indexers(client: httpx.AsyncClient, deployment_cids: tuple, api_key: str) -> dict:
+    variables = {"hashes": list(deployment_cids), "first": len(deployment_cids)}
+
     try:
-        resp = await client.post(url, json={"query": query}, headers=headers, timeout=15)
+        resp = await client.post(_INDEXERS_URL, json={"query": _INDEXERS_QUERY, "variables": variables},
+                                 headers=_gateway_headers(api_key), timeout=15)
         data = resp.json()
-        if "data" in data and data["data"].get("subgraphDeployments"):
-            deps = data["data"]["subgraphDeployments"]
-            if not deps:
-                return {"indexer_count": 0, "indexers": []}
-            dep = deps[0]
-            allocations = dep.get("indexerAllocations", [])
-            return {
-                "indexer_count": len(allocations),
-                "total_stake": dep.get("stakedTokens", "0"),
-                "signal": dep.get("signalledTokens", "0"),
-                "indexers": [
-                    {
-                        "id": a["indexer"]["id"],
-                        "name": a["indexer"].get("defaultDisplayName") or a["indexer"]["id"][:10] + "...",
-                        "allocated": a["allocatedTokens"],
-                    }
-                    for a in allocations[:10]
-                ]
-            }
+        if data.get("data"):
+            by_hash = {d.get("ipfsHash"): d for d in data["data"].get("subgraphDeployments") or []}
+            return {cid: _parse_indexer_info(by_hash.get(cid)) for cid in deployment_cids}
         if "errors" in data:
-            return {"error": data["errors"][0].get("message", "Unknown"), "indexer_count": 0, "indexers": []}
-        return {"indexer_count": 0, "indexers": []}
+            err = {"error": data["errors"][0].get("message", "Unknown"), "indexer_count": 0, "indexers": []}
+            return {cid: dict(err) for cid in deployment_cids}
+        return {cid: {"indexer_count": 0, "indexers": []} for cid in deployment_cids}
     except Exception as e:
-        return {"error": str(e), "indexer_count": 0, "indexers": []}
+        return {cid: {"error": str(e), "indexer_count": 0, "indexers": []} for cid in deployment_cids}
 
 
-async def fetch_chain_block(client: httpx.AsyncClient, network: str, cache: dict) -> Optional[int]:
-    """查询指定链的最新 block"""
-    if network in cache:
-        return cache[network]
-    
+async def _query_chain_head(client: httpx.AsyncClient, network: str) -> Optional[int]:
+    """eth_blockNumber RPC，成功后写入 TTL 缓存"""
     rpc_url = CHAIN_RPCS.get(network)
     if not rpc_url:
         return None
-    
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "eth_blockNumber",
-        "params": [],
-        "id": 1
-    }
+
     try:
-        resp = await client.post(rpc_url, json=payload, timeout=10)
+        resp = await client.post(rpc_url, content=_BLOCK_NUMBER_PAYLOAD, headers=_JSON_HEADERS, timeout=10)
         data = resp.json()
         if "result" in data:
             block = int(data["result"], 16)
-            cache[network] = block
+            _chain_head_cache[network] = (time.monotonic(), block)
             return block
     except:
         pass
     return None
 
 
+async def fetch_chain_block(client: httpx.AsyncClient, network: str, cache: dict) -> Optional[int]:
+    """查询指定链的最新 block (cache 是本次请求内的结果表)"""
+    if network in cache:
+        return cache[network]
+    
+    ts, block = _chain_head_cache.get(network, (0.0, None))
+    if block is None or time.monotonic() - ts >= CHAIN_HEAD_TTL:
+        block = await _single_flight(("chain", network), lambda: _query_chain_head(client, network))
+    
+    if block:
+        cache[network] = block
+    return block
+
+
 async def fetch_entity_stats(client: httpx.AsyncClient) -> dict:
     """获取后端 entity 实时统计(包含 count)"""
     try:
@@ -151,31 +256,75 @@ async def fetch_entity_stats(client: httpx.AsyncClient) -> dict:
     return {}
 
 
-async def fetch_manifest(client: httpx.AsyncClient, deployment_cid: str) -> Optional[dict]:
-    """从 IPFS 获取 subgraph manifest"""
-    if deployment_cid in _manifest_cache:
-        return _manifest_cache[deployment_cid]
-    
+def _is_manifest(manifest) -> bool:
+    """gateway 限流页/HTML 也能被 YAML 解析成 str，只有带 dataSources 的 dict 才是 manifest"""
+    return isinstance(manifest, dict) and "dataSources" in manifest
+
+
+def _load_manifest_disk(deployment_cid: str) -> Optional[dict]:
+    path = MANIFEST_CACHE_DIR / f"{deployment_cid}.json"
     try:
-        url = f"{IPFS_GATEWAY}?arg={deployment_cid}"
-        resp = await client.get(url, timeout=15)
-        if resp.status_code == 200:
-            manifest = yaml.safe_load(resp.text)
-            _manifest_cache[deployment_cid] = manifest
-            return manifest
-    except:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if _is_manifest(manifest) else None
+
+
+def _store_manifest_disk(deployment_cid: str, manifest: dict):
+    path = MANIFEST_CACHE_DIR / f"{deployment_cid}.json"
+    try:
+        MANIFEST_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再 rename，多进程并发写也不会读到半个文件
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(manifest, default=str))
+        tmp.replace(path)
+    except OSError:
         pass
-    
-    # 备用: 公共 IPFS gateway
+
+
+async def _fetch_manifest_from(client: httpx.AsyncClient, url: str) -> Optional[dict]:
     try:
-        url = f"https://ipfs.io/ipfs/{deployment_cid}"
         resp = await client.get(url, timeout=15)
         if resp.status_code == 200:
-            manifest = yaml.safe_load(resp.text)
-            _manifest_cache[deployment_cid] = manifest
-            return manifest
+            # 直接解析 bytes，省掉 resp.text 的 decode; 不是 manifest 的返回 None，让另一个 gateway 胜出
+            manifest = yaml.load(resp.content, Loader=_YamlLoader)
+            if _is_manifest(manifest):
+                return manifest
     except:
         pass
+    return None
+
+
+async def fetch_manifest(client: httpx.AsyncClient, deployment_cid: str) -> Optional[dict]:
+    """从 IPFS 获取 subgraph manifest (L1 内存 → L2 磁盘 → IPFS)"""
+    if deployment_cid in _manifest_cache:
+        return _manifest_cache[deployment_cid]
+    return await _single_flight(("manifest", deployment_cid), lambda: _load_manifest(client, deployment_cid))
+
+
+async def _load_manifest(client: httpx.AsyncClient, deployment_cid: str) -> Optional[dict]:
+    manifest = _load_manifest_disk(deployment_cid)
+    if manifest is not None:
+        _manifest_cache[deployment_cid] = manifest
+        return manifest
+    
+    # 两个 gateway 同时请求，取最先成功的那个，其余取消
+    pending = {
+        asyncio.ensure_future(_fetch_manifest_from(client, f"{IPFS_GATEWAY}?arg={deployment_cid}")),
+        asyncio.ensure_future(_fetch_manifest_from(client, f"{IPFS_FALLBACK_GATEWAY}/{deployment_cid}")),
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                manifest = task.result()
+                if manifest is not None:
+                    _manifest_cache[deployment_cid] = manifest
+                    _store_manifest_disk(deployment_cid, manifest)
+                    return manifest
+    finally:
+        for task in pending:
+            task.cancel()
     
     return None
 
@@ -221,166 +370,160 @@ def parse_contract_nodes(manifest: dict) -> tuple[list, list]:
 
 
 def compute_node_stats(nodes: list, indexed_block: int, chain_block_cache: dict):
-    """计算每个合约节点的统计信息"""
-    progress_list = []
+    """计算每个合约节点的统计信息，返回静态合约的平均 progress"""
+    get_head = chain_block_cache.get
+    total = 0.0
+    count = 0
     for node in nodes:
-        network = node.get("network", "")
-        chain_head = chain_block_cache.get(network)
+        chain_head = get_head(node["network"])
+        synced = bool(chain_head and indexed_block)
         
         node["indexed"] = indexed_block
         node["head"] = chain_head
-        node["behind"] = (chain_head - indexed_block) if chain_head and indexed_block else 0
+        node["behind"] = (chain_head - indexed_block) if synced else 0
         
         # 动态合约没有 start_block，不计算 progress
-        if node.get("type") == "dynamic":
+        if node["type"] == "dynamic":
             continue
         
-        start_block = node.get("start_block", 0)
-        
-        if chain_head and indexed_block:
+        if synced:
+            start_block = node["start_block"]
             total_range = chain_head - start_block
-            indexed_range = indexed_block - start_block
             if total_range > 0:
-                node["progress"] = round(indexed_range / total_range * 100, 2)
+                progress = round((indexed_block - start_block) / total_range * 100, 2)
             else:
-                node["progress"] = 100.0
-            progress_list.append(node["progress"])
+                progress = 100.0
+            total += progress
+            count += 1
         else:
-            node["progress"] = 0
+            progress = 0
+        node["progress"] = progress
     
-    return round(sum(progress_list) / len(progress_list), 2) if progress_list else 0
+    return round(total / count, 2) if count else 0
 
 
 async def get_graph_status_stream() -> AsyncGenerator[dict, None]:
-    """流式获取 graph 状态，每一步 yield 进度"""
-    config = get_config()
-    api_key = config.get("api_key", "")
-    sources = config.get("sources", {})
-    
-    enabled_sources = {k: v for k, v in sources.items() if v.get("enabled", False)}
+    """流式获取 graph 状态: 每个 subgraph 独立跑完整流程，谁先完成谁先 yield"""
+    api_key = get_config().get("api_key", "")
+    enabled_sources = get_enabled_sources()
     total = len(enabled_sources)
     
     if total == 0:
         yield {"type": "status", "msg": "没有启用的数据源"}
-        yield {"type": "done", "data": {"sources": {}}}
+        yield {"type": "done", "data": {"order": []}}
         return
     
-    result = {"sources": {}}
     chain_block_cache = {}
-    backend_entity_stats = {}
+    chain_tasks = {}  # network -> Task，多个 subgraph 共享同一条链的查询
     
-    async with httpx.AsyncClient() as client:
-        # Step 0: 获取后端 entity stats(避免触发后端 COUNT(*))
-        backend_entity_stats = await fetch_entity_stats(client)
-        # Step 1: 并发查询所有 subgraph 的 meta
-        yield {"type": "status", "msg": f"查询 {total} 个 subgraph meta..."}
-        
-        async def fetch_meta_task(name, src):
-            subgraph_id = src.get("subgraph_id", "")
-            meta = await fetch_subgraph_meta(client, subgraph_id, api_key)
-            return name, src, meta
-        
-        meta_tasks = [fetch_meta_task(name, src) for name, src in enabled_sources.items()]
-        meta_results = await asyncio.gather(*meta_tasks)
-        
-        # Step 2: 收集所有需要查询的 deployment CID
-        yield {"type": "status", "msg": "获取 manifest 和 indexer 信息..."}
-        
-        deployment_tasks = []
-        for name, src, meta in meta_results:
-            if not meta.get("error") and meta.get("deployment"):
-                deployment_cid = meta["deployment"]
-                # 并发: manifest + indexer
-                deployment_tasks.append((name, src, meta, deployment_cid))
-        
-        # 并发查询所有 manifest 和 indexer
-        async def fetch_deployment_info(name, src, meta, deployment_cid):
-            manifest_task = fetch_manifest(client, deployment_cid)
-            indexer_task = fetch_deployment_indexers(client, deployment_cid, api_key)
-            manifest, indexer_info = await asyncio.gather(manifest_task, indexer_task)
-            return name, src, meta, deployment_cid, manifest, indexer_info
-        
-        if deployment_tasks:
-            dep_results = await asyncio.gather(*[
-                fetch_deployment_info(*t) for t in deployment_tasks
-            ])
-        else:
-            dep_results = []
+    client = open_graph_client()
+    # Step 0: 获取后端 entity stats(避免触发后端 COUNT(*))
+    backend_entity_stats = await fetch_entity_stats(client)
+    yield {"type": "status", "msg": f"查询 {total} 个 subgraph..."}
+    
+    def fetch_chain_shared(network):
+        if network not in chain_tasks:
+            chain_tasks[network] = asyncio.ensure_future(fetch_chain_block(client, network, chain_block_cache))
+        return chain_tasks[network]
+    
+    # 所有 source 的 meta 同时发出; INDEXER_BATCH_WINDOW 内回来的 deployment 用一次批量查询(ipfsHash_in)取 indexer，
+    # 全部回来就立即发; 某个 gateway 卡住不会拖住其他 source
+    meta_tasks = {name: asyncio.ensure_future(fetch_subgraph_meta(client, subgraph_id, api_key))
+                  for name, subgraph_id, _ in enabled_sources}
+    
+    async def fetch_batched_indexers():
+        done, _ = await asyncio.wait(meta_tasks.values(), timeout=INDEXER_BATCH_WINDOW)
+        metas = [t.result() for t in done]
+        cids = list(dict.fromkeys(m["deployment"] for m in metas if not m.get("error") and m.get("deployment")))
+        return await fetch_deployments_indexers(client, cids, api_key)
+    
+    indexers_task = asyncio.ensure_future(fetch_batched_indexers())
+    
+    async def fetch_indexer_info(deployment_cid):
+        indexer_map = await asyncio.shield(indexers_task)
+        if deployment_cid not in indexer_map:
+            # meta 在批量窗口之后才回来: 单独查自己的
+            indexer_map = await fetch_deployments_indexers(client, [deployment_cid], api_key)
+        return indexer_map.get(deployment_cid, {"indexer_count": 0, "indexers": []})
+    
+    async def process_source(name, subgraph_id, configured_entities):
+        """单个 subgraph 的完整流程: meta → manifest + indexer → chain head → 统计"""
+        # shield: 本 source 超时被取消时不能连带取消共享的 meta / indexer 查询
+        meta = await asyncio.shield(meta_tasks[name])
         
-        # 构建 deployment 信息映射
-        dep_info_map = {}
-        networks_needed = set()
-        for name, src, meta, deployment_cid, manifest, indexer_info in dep_results:
+        deployment_cid = None
+        contract_nodes = []
+        output_entities = []
+        indexer_info = {"indexer_count": 0, "indexers": []}
+        if not meta.get("error") and meta.get("deployment"):
+            deployment_cid = meta["deployment"]
+            # 并发: manifest + indexer
+            manifest, indexer_info = await asyncio.gather(
+                fetch_manifest(client, deployment_cid),
+                fetch_indexer_info(deployment_cid),
+            )
             contract_nodes, output_entities = parse_contract_nodes(manifest)
-            dep_info_map[name] = {
-                "deployment_cid": deployment_cid,
-                "manifest": manifest,
-                "contract_nodes": contract_nodes,
-                "output_entities": output_entities,
-                "indexer_info": indexer_info,
-            }
-            for node in contract_nodes:
-                networks_needed.add(node.get("network", ""))
-        
-        # Step 3: 并发查询所有需要的 chain head
-        networks_needed.discard("")
-        if networks_needed:
-            yield {"type": "status", "msg": f"查询 {len(networks_needed)} 条链的区块高度..."}
             
-            async def fetch_chain_task(network):
-                block = await fetch_chain_block(client, network, chain_block_cache)
-                return network, block
-            
-            chain_results = await asyncio.gather(*[fetch_chain_task(n) for n in networks_needed])
-            for network, block in chain_results:
-                if block:
-                    chain_block_cache[network] = block
+            networks_needed = {node.get("network", "") for node in contract_nodes}
+            networks_needed.discard("")
+            # shield: 本 source 超时被取消时不能连带取消其他 source 共享的 chain 查询
+            await asyncio.gather(*[asyncio.shield(fetch_chain_shared(n)) for n in networks_needed])
         
-        # Step 4: 组装结果
-        yield {"type": "status", "msg": "计算统计数据..."}
+        indexed_block = meta.get("block", {}).get("number", 0) if not meta.get("error") else 0
+        avg_progress = compute_node_stats(contract_nodes, indexed_block, chain_block_cache)
         
-        for name, src, meta in meta_results:
-            subgraph_id = src.get("subgraph_id", "")
-            # entities 现在是 dict: {entity_name: table_name}
-            entity_table_map = src.get("entities", {})
-            configured_entities = list(entity_table_map.keys())
-            
-            if name in dep_info_map:
-                info = dep_info_map[name]
-                deployment_cid = info["deployment_cid"]
-                contract_nodes = info["contract_nodes"]
-                output_entities = info["output_entities"]
-                indexer_info = info["indexer_info"]
-            else:
-                deployment_cid = None
-                contract_nodes = []
-                output_entities = []
-                indexer_info = {"indexer_count": 0, "indexers": []}
-            
-            indexed_block = meta.get("block", {}).get("number", 0) if not meta.get("error") else 0
-            avg_progress = compute_node_stats(contract_nodes, indexed_block, chain_block_cache)
-            
-            # 计算每个 configured entity 的本地记录数(按 source/entity)
-            entity_stats = {}
-            for entity in configured_entities:
-                key = f"{name}/{entity}"
-                stat = backend_entity_stats.get(key, {})
-                entity_stats[entity] = stat.get("count", 0) if isinstance(stat, dict) else 0
-            
-            result["sources"][name] = {
-                "source_name": name,  # 用于前端构建 entity stats key
+        return name, {
+            "source_name": name,  # 用于前端构建 entity stats key
+            "subgraph_id": subgraph_id,
+            "deployment_cid": deployment_cid,
+            "meta": meta,
+            "contract_nodes": contract_nodes,
+            "output_entities": output_entities,
+            "configured_entities": configured_entities,  # 配置的 entities
+            "entity_stats": local_entity_stats(name, configured_entities),  # 每个 entity 的本地记录数
+            "indexer_info": indexer_info,
+            "stats": {
+                "progress": avg_progress,
+            }
+        }
+    
+    def local_entity_stats(name, configured_entities):
+        """每个 configured entity 的本地记录数(按 source/entity)"""
+        entity_stats = {}
+        for entity in configured_entities:
+            stat = backend_entity_stats.get(f"{name}/{entity}", {})
+            entity_stats[entity] = stat.get("count", 0) if isinstance(stat, dict) else 0
+        return entity_stats
+    
+    async def run_source(name, subgraph_id, configured_entities):
+        """超时/异常只影响当前 source: 返回带 meta.error 的 entry，其余 source 照常推送"""
+        try:
+            return await asyncio.wait_for(process_source(name, subgraph_id, configured_entities), SOURCE_TIMEOUT)
+        except Exception as e:
+            error = f"超时 ({SOURCE_TIMEOUT:g}s)" if isinstance(e, TimeoutError) else str(e) or type(e).__name__
+            return name, {
+                "source_name": name,
                 "subgraph_id": subgraph_id,
-                "deployment_cid": deployment_cid,
-                "meta": meta,
-                "contract_nodes": contract_nodes,
-                "output_entities": output_entities,
-                "configured_entities": configured_entities,  # 配置的 entities
-                "entity_stats": entity_stats,  # 每个 entity 的本地记录数
-                "indexer_info": indexer_info,
-                "stats": {
-                    "progress": avg_progress,
-                }
+                "deployment_cid": None,
+                "meta": {"error": error},
+                "contract_nodes": [],
+                "output_entities": [],
+                "configured_entities": configured_entities,
+                "entity_stats": local_entity_stats(name, configured_entities),
+                "indexer_info": {"indexer_count": 0, "indexers": []},
+                "stats": {"progress": 0},
             }
     
+    tasks = [asyncio.ensure_future(run_source(*src)) for src in enabled_sources]
+    try:
+        for finished, next_done in enumerate(asyncio.as_completed(tasks), 1):
+            name, entry = await next_done
+            yield {"type": "source", "name": name, "data": entry}
+            yield {"type": "status", "msg": f"已完成 {finished}/{total} 个 subgraph..."}
+    finally:
+        for t in [*tasks, *meta_tasks.values(), indexers_task, *chain_tasks.values()]:
+            t.cancel()
+    
     yield {"type": "status", "msg": "完成"}
-    yield {"type": "done", "data": result}
+    # 每个 source 已经单独推过了，done 只带配置顺序，前端按顺序拼装
+    yield {"type": "done", "data": {"order": [name for name, _, _ in enabled_sources]}}
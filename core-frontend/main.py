@@ -1,34 +1,101 @@
 from backend_api import BACKEND_API
-from graph_status import get_graph_status_stream
+from graph_status import get_graph_status_stream, open_graph_client, close_graph_client
 from fastapi import FastAPI, Query, Request
 from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from contextlib import asynccontextmanager
+from operator import itemgetter
 from pathlib import Path
+import asyncio
+import time
 import httpx
-import json
+import orjson
 
-app = FastAPI(title="Polymarket Data Explorer")
-templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
 
-# httpx 客户端，禁用代理直连 C++ backend
-_client = httpx.Client(timeout=None, trust_env=False)
+# httpx 客户端，禁用代理直连 C++ backend (lifespan 中创建)
+_client: httpx.AsyncClient = None
+
+# 仪表盘轮询的透传接口: 1s 内的重复请求直接复用上一次 backend 响应
+BACKEND_CACHE_TTL = 1.0
+_backend_cache: dict[tuple, tuple[float, bytes]] = {}  # key -> (过期时刻, body)
+_backend_locks: dict[tuple, asyncio.Lock] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _client
+    # 连接池上限放宽: 并发请求复用 keepalive 连接，不必每次重新握手
+    # 读不设超时(export 可能很久)，但本机连接 2s 连不上直接失败
+    _client = httpx.AsyncClient(
+        base_url=BACKEND_API,
+        timeout=httpx.Timeout(None, connect=2.0),
+        trust_env=False,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    )
+    # The Graph 共享 client: 启动时建好，SSE 请求之间复用 keepalive 连接
+    open_graph_client()
+    yield
+    await close_graph_client()
+    await _client.aclose()
+
+
+app = FastAPI(title="Polymarket Data Explorer", lifespan=lifespan)
+templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
 
 
-def backend_get(path: str, params: dict = None, default=None):
+async def backend_get(path: str, params: dict = None, default=None):
     """通用 backend GET 请求"""
-    resp = _client.get(f"{BACKEND_API}{path}", params=params)
-    return resp.json() if resp.text else (default if default is not None else {})
+    resp = await _client.get(path, params=params)
+    return orjson.loads(resp.content) if resp.content else (default if default is not None else {})
+
+
+async def backend_raw(path: str, params: dict = None, default: bytes = b"{}") -> Response:
+    """backend GET 原样透传，不做 JSON 解析/重编码"""
+    resp = await _client.get(path, params=params)
+    return Response(content=resp.content or default, media_type="application/json")
+
+
+async def backend_cached(path: str, params: dict = None, default: bytes = b"{}") -> Response:
+    """带短 TTL 的 backend_raw: 同一 key 并发 miss 时由锁合并成一次 backend 请求"""
+    key = (path, tuple(sorted(params.items())) if params else ())
+    hit = _backend_cache.get(key)
+    if hit is None or hit[0] <= time.monotonic():
+        async with _backend_locks.setdefault(key, asyncio.Lock()):
+            hit = _backend_cache.get(key)
+            if hit is None or hit[0] <= time.monotonic():
+                _evict_expired()
+                resp = await _client.get(path, params=params)
+                content = resp.content or default
+                # 错误响应不缓存，下次请求直接重试 backend
+                if resp.status_code != 200:
+                    return Response(content=content, media_type="application/json")
+                hit = (time.monotonic() + BACKEND_CACHE_TTL, content)
+                _backend_cache[key] = hit
+    return Response(content=hit[1], media_type="application/json")
+
+
+def _evict_expired():
+    """清掉过期条目和闲置的锁: key 含调用方传入的参数，不清理会无限增长"""
+    now = time.monotonic()
+    for key in [k for k, (expires, _) in _backend_cache.items() if expires <= now]:
+        del _backend_cache[key]
+    for key in [k for k, lock in _backend_locks.items() if k not in _backend_cache and not lock.locked()]:
+        del _backend_locks[key]
+
+
+# backend /api/sync 每行固定返回这些列 (NULL 为 null)，C 层一次取出
+_sync_state_row = itemgetter("source", "entity", "cursor_value", "last_sync_at")
 
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """主页"""
-    stats = backend_get("/api/stats", default={})
-    sync_state_data = backend_get("/api/sync", default=[])
-    sync_state = [
-        (r.get("source"), r.get("entity"), r.get("last_id"), r.get("last_sync_at"))
-        for r in sync_state_data
-    ] if isinstance(sync_state_data, list) else []
+    # 两个请求互不依赖，并发发出
+    stats, sync_state_data = await asyncio.gather(
+        backend_get("/api/stats", default={}),
+        backend_get("/api/sync", default=[]),
+    )
+    sync_state = list(map(_sync_state_row, sync_state_data)) if isinstance(sync_state_data, list) else []
 
     return templates.TemplateResponse("index.html", {
         "request": request,
@@ -40,80 +107,100 @@ async def index(request: Request):
 @app.get("/api/stats")
 async def api_stats():
     """API: 获取统计信息"""
-    return backend_get("/api/stats")
+    return await backend_cached("/api/stats")
 
 
 @app.get("/api/entity-stats")
 async def api_entity_stats():
     """API: 获取 entity 实时统计"""
-    return backend_get("/api/entity-stats")
+    return await backend_cached("/api/entity-stats")
 
 
 @app.get("/api/entity-latest")
 async def api_entity_latest(entity: str = Query(...)):
     """API: 获取某个 entity 最近一条记录(用于 hover)"""
-    return backend_get("/api/entity-latest", {"entity": entity})
+    return await backend_cached("/api/entity-latest", {"entity": entity})
 
 
 @app.get("/api/indexer-fails")
 async def api_indexer_fails(source: str = Query(...), entity: str = Query(...)):
     """API: 获取某个 source/entity 的 indexer 失败计数"""
-    return backend_get("/api/indexer-fails", {"source": source, "entity": entity}, default=[])
+    return await backend_raw("/api/indexer-fails", {"source": source, "entity": entity}, default=b"[]")
 
 
 @app.get("/api/replay-users")
 async def api_replay_users(limit: int = Query(200)):
-    resp = _client.get(f"{BACKEND_API}/api/replay-users", params={"limit": limit})
-    return Response(content=resp.content, media_type="application/json")
+    return await backend_raw("/api/replay-users", {"limit": limit})
 
 
 @app.get("/api/replay-trades")
 async def api_replay_trades(user: str = Query(...), ts: int = Query(...), radius: int = Query(20)):
-    resp = _client.get(f"{BACKEND_API}/api/replay-trades", params={"user": user, "ts": ts, "radius": radius})
-    return Response(content=resp.content, media_type="application/json")
+    return await backend_raw("/api/replay-trades", {"user": user, "ts": ts, "radius": radius})
 
 
 @app.get("/api/replay-positions")
 async def api_replay_positions(user: str = Query(...), ts: int = Query(...)):
-    resp = _client.get(f"{BACKEND_API}/api/replay-positions", params={"user": user, "ts": ts})
-    return Response(content=resp.content, media_type="application/json")
+    return await backend_raw("/api/replay-positions", {"user": user, "ts": ts})
 
 
 @app.get("/api/replay")
 async def api_replay(user: str = Query(...)):
-    resp = _client.get(f"{BACKEND_API}/api/replay", params={"user": user})
-    return Response(content=resp.content, media_type="application/json")
+    return await backend_raw("/api/replay", {"user": user})
 
 
 @app.get("/api/rebuild-all")
 async def api_rebuild_all():
     """API: 触发全量重建"""
-    return backend_get("/api/rebuild-all")
+    return await backend_raw("/api/rebuild-all")
 
 
 @app.get("/api/rebuild-status")
 async def api_rebuild_status():
     """API: 获取重建进度"""
-    return backend_get("/api/rebuild-status")
+    return await backend_raw("/api/rebuild-status")
 
 
 @app.get("/api/rebuild-check-persist")
 async def api_rebuild_check_persist():
-    return backend_get("/api/rebuild-check-persist")
+    return await backend_raw("/api/rebuild-check-persist")
 
 
 @app.get("/api/rebuild-load")
 async def api_rebuild_load():
-    return backend_get("/api/rebuild-load")
-
+    return await backend_raw("/api/rebuild-load")
 
 
 @app.get("/api/graph-status-stream")
 async def api_graph_status_stream():
     """API: 流式获取 The Graph 节点状态 (SSE)"""
     async def event_generator():
-        async for event in get_graph_status_stream():
-            yield f"data: {json.dumps(event)}\n\n"
+        # 后台 pump 把事件编码进队列；每次把已就绪的帧合并成一个 chunk 发出，
+        # source + status 这类连续事件只触发一次 send，SSE 帧格式不变
+        queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for event in get_graph_status_stream():
+                    queue.put_nowait(b"data: " + orjson.dumps(event) + b"\n\n")
+            finally:
+                queue.put_nowait(None)
+
+        task = asyncio.create_task(pump())
+        try:
+            while True:
+                frames = [await queue.get()]
+                while not queue.empty():
+                    frames.append(queue.get_nowait())
+                done = frames[-1] is None
+                if done:
+                    frames.pop()
+                if frames:
+                    yield b"".join(frames)
+                if done:
+                    break
+            await task  # pump 异常在这里抛出
+        finally:
+            task.cancel()
 
     return StreamingResponse(
         event_generator(),
@@ -124,13 +211,13 @@ async def api_graph_status_stream():
 
 @app.get("/api/sync-progress")
 async def api_sync_progress():
-    return backend_get("/api/sync-progress")
+    return await backend_raw("/api/sync-progress")
 
 
 @app.post("/api/fill-token-ids")
 async def api_fill_token_ids():
-    resp = _client.post(f"{BACKEND_API}/api/fill-token-ids")
-    return resp.json()
+    resp = await _client.post("/api/fill-token-ids")
+    return Response(content=resp.content, media_type="application/json")
 
 
 @app.get("/api/export")
@@ -138,6 +225,4 @@ async def api_export(limit: int = Query(100, le=1000), order: str = Query("desc"
     """从本地 DB 导出 entity 数据到 CSV
     order: desc=最新数据, asc=最早数据
     """
-    resp = _client.get(
-        f"{BACKEND_API}/api/export-raw", params={"limit": limit, "order": order})
-    return resp.json()
+    return await backend_raw("/api/export-raw", {"limit": limit, "order": order})
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
+import gzip
+import http.client
 import json
 import sys
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 SCRIPT_DIR = Path(__file__).parent
@@ -102,42 +104,56 @@ fragment TypeRef on __Type {
 """
 
 API_KEY = "1d7a83f3e6778cd93dfbae707bb192de"
+GATEWAY_HOST = "gateway.thegraph.com"
+
+# 请求体固定，只编码一次; introspection 结果大且重复度高，要求 gzip 传输
+PAYLOAD = json.dumps({"query": INTROSPECTION_QUERY}).encode()
+HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0",
+    "Accept-Encoding": "gzip",
+}
 
 
 def fetch_schema(subgraph_id):
     """通过 introspection query 拉取 schema"""
-    url = f"https://gateway.thegraph.com/api/{API_KEY}/subgraphs/id/{subgraph_id}"
-    payload = json.dumps({"query": INTROSPECTION_QUERY}).encode()
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0",
-    }
-    req = urllib.request.Request(url, data=payload, headers=headers)
+    path = f"/api/{API_KEY}/subgraphs/id/{subgraph_id}"
+    # 各 subgraph 在不同线程并发拉取，每次一条独立连接 (HTTPSConnection 不能跨线程共享)
+    conn = http.client.HTTPSConnection(GATEWAY_HOST, timeout=60)
     try:
-        with urllib.request.urlopen(req) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        print(f"  URL: {url}")
-        print(f"  Error: {e.code} {e.reason}")
-        print(f"  Body: {e.read().decode()}")
-        raise
+        conn.request("POST", path, body=PAYLOAD, headers=HEADERS)
+        resp = conn.getresponse()
+        body = resp.read()
+    finally:
+        conn.close()
+    if resp.getheader("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    if resp.status != 200:
+        print(f"  URL: https://{GATEWAY_HOST}{path}")
+        print(f"  Error: {resp.status} {resp.reason}")
+        print(f"  Body: {body.decode()}")
+        raise RuntimeError(f"HTTP {resp.status} {resp.reason}")
+    return json.loads(body)
 
 
 def resolve_type(t):
-    """递归解析类型，返回类型字符串"""
-    if t is None:
-        return "?"
-    kind = t.get("kind")
-    name = t.get("name")
-    of_type = t.get("ofType")
-
-    if kind == "NON_NULL":
-        return resolve_type(of_type) + "!"
-    elif kind == "LIST":
-        return "[" + resolve_type(of_type) + "]"
-    elif name:
-        return name
-    return "?"
+    """沿 ofType 链迭代解析类型，返回类型字符串 (不递归，包装符号最后一次拼接)"""
+    prefix, suffix = "", ""
+    while t is not None:
+        kind = t.get("kind")
+        if kind == "NON_NULL":
+            suffix = "!" + suffix
+        elif kind == "LIST":
+            prefix += "["
+            suffix = "]" + suffix
+        else:
+            return prefix + (t.get("name") or "?") + suffix
+        t = t.get("ofType")
+    return prefix + "?" + suffix
+
+
+# 去掉类型串里的 ! [ ] 得到基础类型名
+_STRIP = str.maketrans("", "", "![]")
 
 
 def convert_schema(data, output_file=None):
@@ -175,6 +191,21 @@ def convert_schema(data, output_file=None):
         elif kind == "SCALAR" and name not in builtin_scalars:
             scalars.append(t)
 
+    # 被引用实体展开后的子字段行: 同一实体 (如 Token) 被多处引用时只生成一次
+    sub_fields_cache = {}
+
+    def sub_field_lines(entity_name):
+        cached = sub_fields_cache.get(entity_name)
+        if cached is None:
+            cached = []
+            for sf in type_map[entity_name].get("fields") or []:
+                sf_type = resolve_type(sf["type"])
+                # 只展开一层，不再递归
+                if sf_type.translate(_STRIP) not in entity_names:
+                    cached.append(f"    .{sf['name']}: {sf_type}")
+            sub_fields_cache[entity_name] = cached
+        return cached
+
     lines = []
 
     # 自定义 Scalars
@@ -201,8 +232,7 @@ def convert_schema(data, output_file=None):
             ftype = resolve_type(field["type"])
 
             # 获取基础类型名（去掉 !, [] 等）
-            base_type = ftype.replace("!", "").replace(
-                "[", "").replace("]", "")
+            base_type = ftype.translate(_STRIP)
 
             if fdesc:
                 lines.append(f"  # {fdesc}")
@@ -210,16 +240,7 @@ def convert_schema(data, output_file=None):
 
             # 展开子字段
             if base_type in entity_names and base_type in type_map:
-                sub_entity = type_map[base_type]
-                sub_fields = sub_entity.get("fields") or []
-                for sf in sub_fields:
-                    sf_name = sf["name"]
-                    sf_type = resolve_type(sf["type"])
-                    sf_base = sf_type.replace("!", "").replace(
-                        "[", "").replace("]", "")
-                    # 只展开一层，不再递归
-                    if sf_base not in entity_names:
-                        lines.append(f"    .{sf_name}: {sf_type}")
+                lines.extend(sub_field_lines(base_type))
 
         lines.append("}")
 
@@ -260,9 +281,9 @@ def pull_and_convert(name, subgraph_id, deployment_id):
 
 
 def pull_all():
-    """拉取并转换所有 subgraphs"""
-    for name, subgraph_id, deployment_id in SUBGRAPHS:
-        pull_and_convert(name, subgraph_id, deployment_id)
+    """拉取并转换所有 subgraphs: 各自写不同的 .graphql 文件，并发拉取，总耗时取决于最慢的一个"""
+    with ThreadPoolExecutor(max_workers=len(SUBGRAPHS)) as ex:
+        list(ex.map(lambda s: pull_and_convert(*s), SUBGRAPHS))
 
 
 if __name__ == "__main__":
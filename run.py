@@ -12,6 +12,9 @@ BACKEND_DIR = ROOT / "core-backend"
 BACKEND_BUILD = BACKEND_DIR / "projects" / "core" / "build"
 FRONTEND_DIR = ROOT / "core-frontend"
 CONFIG_FILE = ROOT / "config.json"
+# uvicorn worker 进程数: 各 worker 独立事件循环，并发刷新时分摊到多核
+# (--loop/--http 保持 auto: 装了 uvloop / httptools 会自动使用，没装也能启动)
+FRONTEND_WORKERS = 4
 
 # Windows 下的可执行文件名
 BACKEND_EXE = BACKEND_BUILD / \
@@ -23,13 +26,14 @@ def build_backend():
     print("[run.py] 编译 C++ backend...")
     BACKEND_BUILD.mkdir(parents=True, exist_ok=True)
 
-    # cmake 配置
-    result = subprocess.run([
-        "cmake", "..",
-        "-DCMAKE_C_COMPILER=clang",
-        "-DCMAKE_CXX_COMPILER=clang++"
-    ], cwd=BACKEND_BUILD)
-    assert result.returncode == 0, "cmake 配置失败"
+    # cmake 配置: 只在首次(没有 CMakeCache)时跑，之后 CMakeLists 变了 --build 会自动重新配置
+    if not (BACKEND_BUILD / "CMakeCache.txt").exists():
+        result = subprocess.run([
+            "cmake", "..",
+            "-DCMAKE_C_COMPILER=clang",
+            "-DCMAKE_CXX_COMPILER=clang++"
+        ], cwd=BACKEND_BUILD)
+        assert result.returncode == 0, "cmake 配置失败"
 
     # cmake 编译
     result = subprocess.run(
@@ -63,7 +67,7 @@ def wait_for_port(host: str, port: int, timeout: int = 30):
             sock.close()
             return True
         except (socket.timeout, ConnectionRefusedError, OSError):
-            time.sleep(0.2)
+            time.sleep(0.05)
     return False
 
 
@@ -109,14 +113,16 @@ def main():
     print("[run.py] 启动 frontend...")
     frontend_proc = subprocess.Popen(
         [sys.executable, "-m", "uvicorn", "main:app", "--host",
-            "0.0.0.0", "--port", "8000", "--log-level", "warning"],
+            "0.0.0.0", "--port", "8000", "--workers", str(FRONTEND_WORKERS),
+            "--log-level", "warning"],
         cwd=FRONTEND_DIR,
         start_new_session=True,
     )
     processes.append(frontend_proc)
 
-    # 5. 等待服务就绪，打开浏览器
-    time.sleep(2)
+    # 5. 等待 frontend 端口就绪再打开浏览器 (不固定 sleep: 快机器不白等，慢机器不打开空白页)
+    if not wait_for_port("127.0.0.1", 8000, timeout=10):
+        print("[run.py] 警告: frontend 10s 内未就绪")
     url = "http://localhost:8000"
     print(f"[run.py] 打开浏览器: {url}")
     webbrowser.open(url)